@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Check the cold-start cost of importing jsonpipe and each of its entry points.
+
+Every target is imported in a fresh interpreter several times, and none of the
+modules the target has no need for may have been imported; this is the main
+check, and is exact. The best time, less that of an interpreter which imports
+nothing, is also compared with the target's budget. Budgets are set for an
+interpreter which starts in about 10 ms, and grow in proportion on machines
+where it takes longer. Timings are noisy, so a target within half as much
+again as its budget is only reported as slow. Where the interpreter supports
+``-X importtime`` (Python 3.7+), the slowest imports are shown for any target
+which is slow or fails.
+
+    $ python check_startup.py [--runs N] [--scale FACTOR]
+
+Exits with a non-zero status if any target fails.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import argparse
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules only some operations need, so should never be imported up front.
+OPTIONAL = ['argparse', 'doctest', 'inspect', 'tempfile', 'hashlib', 'sqlite3',
+            'socket', 'multiprocessing', 'Queue', 'zlib', 'bz2', 'lzma',
+            'jsonpipe.batch', 'jsonpipe.summary', 'jsonpipe.disk',
+            'jsonpipe.server']
+
+# (statement, budget in milliseconds, modules which must not be imported)
+TARGETS = [
+    ('import jsonpipe', 20, OPTIONAL + ['jsonpipe.cli']),
+    ('from jsonpipe.cli import main', 30, OPTIONAL[1:]),
+    ('from jsonpipe.cli import main_unpipe', 30, OPTIONAL[1:]),
+    ('from jsonpipe.cli import main_diff', 30, OPTIONAL[1:]),
+    ('from jsonpipe_client import main', 12,
+     ['jsonpipe', 'simplejson', 'argparse']),
+]
+
+# How long (in milliseconds) the interpreter took to start on its own where
+# the budgets were set.
+REFERENCE_BASELINE = 10.0
+# How far over budget a target may be before it fails, as a fraction.
+MARGIN = 0.5
+
+
+def run(python, statement, *options):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(HERE, 'src')] +
+        filter(None, [os.environ.get('PYTHONPATH')]))
+    process = subprocess.Popen([python] + list(options) + ['-c', statement],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               env=env)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError("%r failed:\n%s" % (statement, stderr))
+    return stdout, stderr
+
+
+def best_time(python, statement, runs):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        run(python, statement)
+        times.append(time.time() - start)
+    return min(times) * 1000
+
+
+def imported_modules(python, statement):
+    stdout, _ = run(python, statement + '\nimport sys\n'
+                    'sys.stdout.write("\\n".join(sys.modules))')
+    return set(stdout.split())
+
+
+def slowest_imports(python, statement, count=10):
+    try:
+        _, stderr = run(python, statement, '-X', 'importtime')
+    except RuntimeError:
+        return []
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            fields = line[len('import time:'):].split('|')
+            if fields[1].strip().isdigit():
+                imports.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+PARSER = argparse.ArgumentParser(
+    description="Check the startup time of jsonpipe's entry points.")
+PARSER.add_argument('--python', default=sys.executable,
+                    help="The interpreter to check (default: this one)")
+PARSER.add_argument('--runs', type=int, default=10,
+                    help="Interpreters to start per target (default: 10)")
+PARSER.add_argument('--scale', type=float, default=1.0,
+                    help="Multiply every budget by this, for slow machines")
+
+
+def main():
+    args = PARSER.parse_args()
+
+    baseline = best_time(args.python, 'pass', args.runs)
+    print "%-40s %8.1f ms" % ('(interpreter)', baseline)
+    scale = args.scale * max(1.0, baseline / REFERENCE_BASELINE)
+
+    failed = False
+    for statement, budget, unneeded in TARGETS:
+        budget *= scale
+        cost = best_time(args.python, statement, args.runs) - baseline
+        extra = sorted(set(unneeded) & imported_modules(args.python,
+                                                        statement))
+        if extra or cost > budget * (1 + MARGIN):
+            status = 'FAIL'
+            failed = True
+        elif cost > budget:
+            status = 'slow'
+        else:
+            status = 'ok'
+        print "%-40s %8.1f ms  (budget %.1f ms)  %s" % (
+            statement, cost, budget, status)
+        if extra:
+            print "    unneeded imports: %s" % (', '.join(extra),)
+        if status != 'ok':
+            for microseconds, module in slowest_imports(args.python,
+                                                        statement):
+                print "    %8.1f ms  %s" % (microseconds / 1000.0, module)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
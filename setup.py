@@ -27,8 +27,13 @@ setup(
     url='http://github.com/dvxhouse/jsonpipe',
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
-    entry_points={'console_scripts': ['jsonpipe = jsonpipe:main',
-                                      'jsonunpipe = jsonpipe:main_unpipe']},
+    py_modules=['jsonpipe_client'],
+    entry_points={'console_scripts': [
+        'jsonpipe = jsonpipe.cli:main',
+        'jsonunpipe = jsonpipe.cli:main_unpipe',
+        'jsonpipe-diff = jsonpipe.cli:main_diff',
+        'jsonpipe-server = jsonpipe.server:main',
+        'jsonpipe-client = jsonpipe_client:main']},
     install_requires=['simplejson>=2.1.3', 'argparse>=1.1', 'calabash==0.0.3'],
     test_suite='jsonpipe._get_tests',
 )
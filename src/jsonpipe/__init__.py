@@ -1,14 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import sys
+from pipe import (jsonpipe, jsonunpipe, jsonpatch_lines, jsoncolumns, diff,
+                  diff_lines)
 
-import argparse
-import simplejson
 
-from pipe import jsonpipe, jsonunpipe
-
-
-__all__ = ['jsonpipe', 'jsonunpipe']
+__all__ = ['jsonpipe', 'jsonunpipe', 'jsonpatch_lines', 'jsoncolumns',
+           'diff', 'diff_lines']
 __version__ = '0.0.8'
 
 
@@ -18,7 +15,14 @@ def _get_tests():
     import sys
     import unittest
 
+    import jsonpipe.batch
+    import jsonpipe.cli
+    import jsonpipe.disk
+    import jsonpipe.server
     import jsonpipe.sh
+    import jsonpipe.streams
+    import jsonpipe.summary
+    import jsonpipe_client
 
     def _from_module(module, object):
         """Backported fix for http://bugs.python.org/issue1108."""
@@ -53,28 +57,19 @@ def _get_tests():
     return suite
 
 
-PARSER = argparse.ArgumentParser()
-PARSER.add_argument('-s', '--separator', metavar='SEP', default='/',
-                    help="Set a custom path component separator (default: /)")
-PARSER.add_argument('-v', '--version', action='version',
-                    version='%%(prog)s v%s' % (__version__,))
-
+# The console scripts live in `jsonpipe.cli`, so that importing the library
+# doesn't pay for building their argument parsers (or importing argparse).
 
 def main():
-    args = PARSER.parse_args()
-
-    # Load JSON from stdin, preserving the order of object keys.
-    json_obj = simplejson.load(sys.stdin,
-                               object_pairs_hook=simplejson.OrderedDict)
-    for line in jsonpipe(json_obj, pathsep=args.separator):
-        print line
+    from jsonpipe.cli import main
+    return main()
 
 
 def main_unpipe():
-    args = PARSER.parse_args()
+    from jsonpipe.cli import main_unpipe
+    return main_unpipe()
+
 
-    simplejson.dump(
-        jsonunpipe(iter(sys.stdin), pathsep=args.separator,
-                   decoder=simplejson.JSONDecoder(
-                       object_pairs_hook=simplejson.OrderedDict)),
-        sys.stdout)
+def main_diff():
+    from jsonpipe.cli import main_diff
+    return main_diff()
@@ -0,0 +1,126 @@
+"""
+Running jsonpipe over many files at once, for ``jsonpipe -j``/``-r``.
+
+Each file is processed by a worker in a pool of processes (or threads), which
+returns the file's whole output; the results are then written out in the
+order the files were given, or as they come.
+"""
+
+import multiprocessing
+import multiprocessing.pool
+import os
+
+from jsonpipe.cli import process_file
+
+
+__all__ = ['find_files', 'run']
+
+
+# The names of the files found by --recursive.
+EXTENSIONS = ('.json', '.json.gz', '.json.bz2', '.json.xz')
+
+
+def find_files(directory):
+
+    """
+    Yield the paths of the JSON files under `directory`, in sorted order.
+
+        >>> import os, shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> os.mkdir(os.path.join(directory, 'a'))
+        >>> for name in ['b.json', 'a/c.json.gz', 'a/notes.txt', 'a.json']:
+        ...     open(os.path.join(directory, name), 'w').close()
+        >>> [os.path.relpath(path, directory)
+        ...  for path in find_files(directory)]
+        ['a.json', 'b.json', 'a/c.json.gz']
+        >>> shutil.rmtree(directory)
+    """
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+class Buffer(object):
+
+    """Collects a file's output in a worker, encoding it as UTF-8."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.chunks.append(data)
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+def render(task):
+    """Process one file in a worker, returning (path, output, error)."""
+
+    args, path = task
+    output = Buffer()
+    try:
+        process_file(args, path, output)
+    except (IOError, ValueError), exc:
+        return path, output.getvalue(), str(exc)
+    return path, output.getvalue(), None
+
+
+def run(args, paths, jobs, threads=False, ordered=True):
+
+    r"""
+    Process the files at `paths` in a pool of `jobs` workers.
+
+    `args` are jsonpipe's command-line arguments. Yields ``(path, output,
+    error)`` for each file, in the order of `paths` unless `ordered` is
+    false; `error` is a message if the file couldn't be processed, in which
+    case `output` holds whatever came before the error.
+
+        >>> import os, shutil, tempfile
+        >>> from jsonpipe.cli import PARSER
+        >>> directory = tempfile.mkdtemp()
+        >>> corrupt = '\x1f\x8b\x08\x00' + 'junk' * 4
+        >>> for name, content in [('a.json', '{"x": 1}'), ('b.json', '[2]'),
+        ...                       ('b.json.gz', corrupt),
+        ...                       ('c.json', '{"x/y": 3}')]:
+        ...     open(os.path.join(directory, name), 'w').write(content)
+        >>> args = PARSER.parse_args([])
+        >>> for path, output, error in run(args, sorted(find_files(directory)),
+        ...                                2, threads=True):
+        ...     print repr(output), error
+        '/\t{}\n/x\t1\n' None
+        '/\t[]\n/0\t2\n' None
+        '' Invalid gzip data in .../b.json.gz (Error -3 while decompressing...)
+        '/\t{}\n' Path separator '/' present in key 'x/y'
+        >>> shutil.rmtree(directory)
+
+    Worker processes can't read this process' standard input, so threads are
+    always used if it's one of the `paths` (as ``-``):
+
+        >>> import sys
+        >>> from StringIO import StringIO
+        >>> stdin, sys.stdin = sys.stdin, StringIO('[1]')
+        >>> list(run(args, ['-'], 2))
+        [('-', '/\t[]\n/0\t1\n', None)]
+        >>> sys.stdin = stdin
+    """
+
+    paths = list(paths)
+    if threads or '-' in paths:
+        pool = multiprocessing.pool.ThreadPool(jobs or None)
+    else:
+        pool = multiprocessing.Pool(jobs or None)
+    try:
+        tasks = ((args, path) for path in paths)
+        results = pool.imap if ordered else pool.imap_unordered
+        for result in results(render, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
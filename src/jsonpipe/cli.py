@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+"""Command-line entry points; imported only when one of them is run."""
+
+import errno
+import itertools
+import os
+import sys
+
+import argparse
+import simplejson
+
+from jsonpipe import __version__
+from jsonpipe.pipe import (jsonpipe, jsonunpipe, jsonpatch_lines, jsoncolumns,
+                           diff, diff_lines)
+from jsonpipe.streams import open_input, open_output
+
+
+COMMON_PARSER = argparse.ArgumentParser(add_help=False)
+COMMON_PARSER.add_argument('-s', '--separator', metavar='SEP', default='/',
+                           help="Set a custom path component separator "
+                                "(default: /)")
+COMMON_PARSER.add_argument('-v', '--version', action='version',
+                           version='%%(prog)s v%s' % (__version__,))
+
+# Input and output files, either of which may be compressed.
+OUTPUT_PARSER = argparse.ArgumentParser(add_help=False)
+OUTPUT_PARSER.add_argument('-o', '--output', metavar='FILE', default='-',
+                           help="The output file, compressed if it ends in "
+                                ".gz, .bz2 or .xz (default: stdout)")
+INPUT_HELP = "may be gzip-, bzip2- or xz-compressed"
+
+PARSER = argparse.ArgumentParser(parents=[COMMON_PARSER, OUTPUT_PARSER])
+PARSER.add_argument('files', metavar='FILE', nargs='*',
+                    help="The input files, which " + INPUT_HELP + " (default: "
+                         "stdin, unless --recursive is given)")
+PARSER.add_argument('--max-depth', metavar='N', type=int,
+                    help="Leave out containers more than N levels down; those "
+                         "at the cut-off are followed by their number of "
+                         "children")
+PARSER.add_argument('--max-items', metavar='K', type=int,
+                    help="Output only the first K elements of each array, "
+                         "which is followed by its length")
+PARSER.add_argument('--sample', metavar='K', type=int, default=0,
+                    help="Also output K elements of each longer array, "
+                         "picked at random")
+PARSER.add_argument('--seed', metavar='SEED', type=int,
+                    help="Seed the random choices of --sample, for "
+                         "repeatable output")
+PARSER.add_argument('--limit', metavar='LINES', type=int,
+                    help="Stop after LINES lines of output per file")
+PARSER.add_argument('-r', '--recursive', metavar='DIR', action='append',
+                    default=[],
+                    help="Also process every .json file under DIR (which may "
+                         "be compressed, e.g. .json.gz); may be repeated")
+PARSER.add_argument('-H', '--with-filename', action='store_true',
+                    default=False,
+                    help="Prefix each output line with the name of its file "
+                         "and a tab")
+PARSER.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                    help="Process files in N worker processes (0 for one per "
+                         "CPU; default: 1)")
+PARSER.add_argument('--threads', action='store_true', default=False,
+                    help="With -j, use worker threads instead of processes")
+PARSER.add_argument('--unordered', action='store_true', default=False,
+                    help="With -j, output each file as soon as it is done, "
+                         "rather than in the order the files were given")
+PARSER.add_argument('--summary', action='store_true', default=False,
+                    help="Output per-path statistics instead of the paths "
+                         "themselves (array indices are folded into '*')")
+PARSER.add_argument('--sort-keys', action='store_true', default=False,
+                    help="Output paths in canonical, byte-sorted order (as "
+                         "LC_ALL=C sort would), ready for join/comm")
+PARSER.add_argument('--columns', metavar='PATHS',
+                    help="Output one tab-separated row per element of a "
+                         "top-level array (or per line of newline-delimited "
+                         "JSON), holding the comma-separated paths given, "
+                         "e.g. '/*/id,/*/user/name'")
+
+UNPIPE_PARSER = argparse.ArgumentParser(parents=[COMMON_PARSER,
+                                                 OUTPUT_PARSER])
+UNPIPE_PARSER.add_argument('file', metavar='FILE', nargs='?', default='-',
+                           help="The input file, which " + INPUT_HELP +
+                                " (default: stdin)")
+UNPIPE_PARSER.add_argument('-b', '--base', metavar='FILE',
+                           help="Apply the input lines as a patch to the JSON "
+                                "document in FILE, instead of starting from "
+                                "an empty object ('undefined' deletes a path)")
+UNPIPE_PARSER.add_argument('-d', '--disk', action='store_true', default=False,
+                           help="Reassemble the document in a temporary "
+                                "on-disk database rather than in memory")
+UNPIPE_PARSER.add_argument('--max-memory', metavar='MB', type=int, default=64,
+                           help="With --disk, the most memory to use for "
+                                "caching the database (default: 64)")
+UNPIPE_PARSER.add_argument('--tmpdir', metavar='DIR',
+                           help="With --disk, where to create the database "
+                                "(default: $TMPDIR)")
+
+DIFF_PARSER = argparse.ArgumentParser(parents=[COMMON_PARSER])
+DIFF_PARSER.add_argument('old',
+                         help="The original JSON file ('-' for stdin)")
+DIFF_PARSER.add_argument('new',
+                         help="The changed JSON file ('-' for stdin)")
+DIFF_PARSER.add_argument('-p', '--patch', action='store_true', default=False,
+                         help="Output a jsonpipe-format patch which turns "
+                              "the old document into the new one")
+DIFF_PARSER.add_argument('--sorted', action='store_true', default=False,
+                         help="The inputs are jsonpipe output in canonical "
+                              "order (as from jsonpipe --sort-keys), which is "
+                              "compared a line at a time instead of parsing "
+                              "both documents into memory")
+
+
+def _read_documents(stream):
+
+    r"""
+    Read either a single JSON document or newline-delimited JSON.
+
+    Returns an iterator over the documents, and whether the input was
+    newline-delimited. It is if its first line holds a whole JSON value and
+    more lines follow; the documents are then parsed one line at a time,
+    without reading ahead:
+
+        >>> from StringIO import StringIO
+        >>> documents, ndjson = _read_documents(StringIO('[1, 2]\n[3]\n'))
+        >>> list(documents), ndjson
+        ([[1, 2], [3]], True)
+        >>> documents, ndjson = _read_documents(StringIO('[\n 1,\n 2\n]\n'))
+        >>> list(documents), ndjson
+        ([[1, 2]], False)
+        >>> documents, ndjson = _read_documents(StringIO('\n{"a": 1}\n'))
+        >>> list(documents), ndjson
+        ([OrderedDict([('a', 1)])], False)
+    """
+
+    decoder = simplejson.JSONDecoder(object_pairs_hook=simplejson.OrderedDict)
+
+    def next_line():
+        # Not `for line in stream`, whose read-ahead would break read().
+        line = stream.readline()
+        while line and not line.strip():
+            line = stream.readline()
+        return line
+
+    def documents(first, second):
+        yield first
+        yield decoder.decode(second)
+        for line in stream:
+            if line.strip():
+                yield decoder.decode(line)
+
+    first = next_line()
+    try:
+        value, end = decoder.raw_decode(first.strip())
+        complete = end == len(first.strip())
+    except ValueError:
+        complete = False
+    if complete:
+        second = next_line()
+        if second:
+            return documents(value, second), True
+        return iter([value]), False
+    return iter([decoder.decode(first + stream.read())]), False
+
+
+def _load_records(stream):
+
+    r"""
+    Yield records from a top-level JSON array or newline-delimited JSON.
+
+    The records are the elements of a single array, a single object on its
+    own, or else each of the documents (which may themselves be arrays):
+
+        >>> from StringIO import StringIO
+        >>> list(_load_records(StringIO('[{"id": 1},\n {"id": 2}]')))
+        [OrderedDict([('id', 1)]), OrderedDict([('id', 2)])]
+        >>> list(_load_records(StringIO('[1, 2]\n[3, 4]\n')))
+        [[1, 2], [3, 4]]
+        >>> list(_load_records(StringIO('{"id": 1}\n')))
+        [OrderedDict([('id', 1)])]
+        >>> list(_load_records(StringIO('"id"')))
+        Traceback (most recent call last):
+        ...
+        ValueError: Expected an array of records, or an object, not "id"
+    """
+
+    documents, ndjson = _read_documents(stream)
+    if ndjson:
+        return documents
+    document = next(documents)
+    if isinstance(document, list):
+        return iter(document)
+    elif isinstance(document, dict):
+        return iter([document])
+    raise ValueError("Expected an array of records, or an object, not %s" %
+                     (simplejson.dumps(document),))
+
+
+def _open(parser, args):
+    """Open the input and output files, reporting failure as a usage error."""
+
+    try:
+        return open_input(args.file), open_output(args.output)
+    except IOError, exc:
+        parser.error(str(exc))
+
+
+def _close(input, output):
+    # Closing a compressed output finishes it off, so mustn't be skipped.
+    input.close()
+    if output is not sys.stdout:
+        output.close()
+
+
+def _load(parser, path):
+    try:
+        stream = open_input(path)
+    except IOError, exc:
+        parser.error(str(exc))
+    try:
+        return simplejson.load(stream,
+                               object_pairs_hook=simplejson.OrderedDict)
+    finally:
+        stream.close()
+
+
+def _lines(args, input):
+    """Yield jsonpipe's output lines for one input file."""
+
+    if args.columns:
+        for row in jsoncolumns(_load_records(input), args.columns.split(','),
+                               pathsep=args.separator):
+            yield row
+        return
+
+    if args.summary:
+        # Each newline-delimited document is folded into the statistics as it
+        # is read, so only the statistics are ever held in memory.
+        from jsonpipe.summary import summarize, summary_lines
+        stats = None
+        for document in _read_documents(input)[0]:
+            stats = summarize(document, pathsep=args.separator, stats=stats)
+        for line in summary_lines(stats):
+            yield line
+        return
+
+    # Load JSON, preserving the order of object keys.
+    json_obj = simplejson.load(input, object_pairs_hook=simplejson.OrderedDict)
+    lines = jsonpipe(json_obj, pathsep=args.separator,
+                     sort_keys=args.sort_keys, max_depth=args.max_depth,
+                     max_items=args.max_items, sample=args.sample,
+                     seed=args.seed)
+    for line in lines:
+        yield line
+
+
+def display_name(path):
+    return '(standard input)' if path == '-' else path
+
+
+def process_file(args, path, output):
+
+    """
+    Write jsonpipe's output for the file at `path` (``-`` for stdin).
+
+    Errors in the file (e.g. invalid JSON, or a key containing the separator)
+    are raised, after whatever output came before them.
+    """
+
+    prefix = display_name(path) + '\t' if args.with_filename else ''
+    input = open_input(path)
+    try:
+        # Stopping early also stops newline-delimited input being read.
+        for line in itertools.islice(_lines(args, input), args.limit):
+            output.write(prefix + line + '\n')
+    finally:
+        input.close()
+
+
+def main():
+    args = PARSER.parse_args()
+    for option in ['jobs', 'max_depth', 'max_items', 'sample', 'limit']:
+        if (getattr(args, option) or 0) < 0:
+            PARSER.error("argument --%s: must not be negative" %
+                         (option.replace('_', '-'),))
+    if ((args.summary or args.columns) and
+            (args.max_depth is not None or args.max_items is not None or
+             args.sample)):
+        PARSER.error("--max-depth, --max-items and --sample cannot be used "
+                     "with --summary or --columns")
+    if args.sample and args.max_items is None:
+        # Just the random sample, then.
+        args.max_items = 0
+
+    paths = list(args.files)
+    if args.recursive:
+        from jsonpipe.batch import find_files
+        for directory in args.recursive:
+            if not os.path.isdir(directory):
+                PARSER.error("%s is not a directory" % (directory,))
+            paths.extend(find_files(directory))
+    elif not paths:
+        paths = ['-']
+
+    try:
+        output = open_output(args.output)
+    except IOError, exc:
+        PARSER.error(str(exc))
+
+    # Errors in one file are reported, and the rest are still processed.
+    failed = False
+    try:
+        if args.jobs == 1:
+            for path in paths:
+                try:
+                    process_file(args, path, output)
+                except (IOError, ValueError), exc:
+                    if getattr(exc, 'errno', None) == errno.EPIPE:
+                        # Nobody is reading the output; there's no point.
+                        raise
+                    _report(output, path, exc)
+                    failed = True
+        else:
+            from jsonpipe.batch import run
+            for path, text, error in run(args, paths, args.jobs,
+                                         threads=args.threads,
+                                         ordered=not args.unordered):
+                output.write(text)
+                if error is not None:
+                    _report(output, path, error)
+                    failed = True
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if failed:
+        sys.exit(1)
+
+
+def _report(output, path, error):
+    # Flush first, so that the message follows the file's partial output.
+    output.flush()
+    sys.stderr.write('%s: %s: %s\n' % (PARSER.prog, display_name(path),
+                                       error))
+
+
+def main_unpipe():
+    args = UNPIPE_PARSER.parse_args()
+    if args.disk and args.base:
+        UNPIPE_PARSER.error("--disk cannot be used with --base")
+
+    decoder = simplejson.JSONDecoder(object_pairs_hook=simplejson.OrderedDict)
+    base = _load(UNPIPE_PARSER, args.base) if args.base else None
+    input, output = _open(UNPIPE_PARSER, args)
+    try:
+        if args.disk:
+            from jsonpipe.disk import jsonunpipe_disk
+            for chunk in jsonunpipe_disk(
+                    iter(input), pathsep=args.separator, decoder=decoder,
+                    max_memory=args.max_memory * 1024 * 1024,
+                    tempdir=args.tmpdir):
+                output.write(chunk)
+        elif args.base:
+            simplejson.dump(jsonpatch_lines(base, iter(input),
+                                            pathsep=args.separator,
+                                            decoder=decoder), output)
+        else:
+            simplejson.dump(jsonunpipe(iter(input), pathsep=args.separator,
+                                       decoder=decoder), output)
+    finally:
+        _close(input, output)
+
+
+def main_diff():
+    args = DIFF_PARSER.parse_args()
+
+    if args.sorted:
+        try:
+            inputs = [open_input(args.old), open_input(args.new)]
+        except IOError, exc:
+            DIFF_PARSER.error(str(exc))
+        lines = diff_lines(inputs[0], inputs[1], pathsep=args.separator,
+                           patch=args.patch)
+    else:
+        # Key order is irrelevant here; the diff is computed in canonical
+        # order. Both documents are held in memory, though.
+        inputs = []
+        lines = diff(_load(DIFF_PARSER, args.old),
+                     _load(DIFF_PARSER, args.new),
+                     pathsep=args.separator, patch=args.patch)
+
+    different = False
+    try:
+        for line in lines:
+            different = True
+            print line
+    except ValueError, exc:
+        DIFF_PARSER.exit(2, '%s: error: %s\n' % (DIFF_PARSER.prog, exc))
+    finally:
+        for input in inputs:
+            input.close()
+    sys.exit(1 if different else 0)
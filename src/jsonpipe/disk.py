@@ -0,0 +1,339 @@
+import os
+import sqlite3
+import tempfile
+
+import simplejson
+
+from pipe import DELETED, is_value
+
+
+__all__ = ['jsonunpipe_disk']
+
+
+# Default size of SQLite's page cache, in bytes.
+MAX_MEMORY = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    key TEXT,
+    -- Index within the parent array, or NULL for object members.
+    position INTEGER,
+    -- '{}', '[]' or an encoded value; NULL if the node was only deleted.
+    value TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    -- Whether the node is an object only assumed for a longer path, which
+    -- may yet turn out to be an array.
+    implied INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (parent, key)
+);
+CREATE INDEX children ON nodes (parent, position);
+"""
+
+DESCENDANTS = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT id FROM nodes WHERE parent = ?
+    UNION ALL
+    SELECT nodes.id FROM nodes JOIN subtree ON nodes.parent = subtree.id
+)
+"""
+
+
+def jsonunpipe_disk(lines, pathsep='/', decoder=simplejson._default_decoder,
+                    max_memory=MAX_MEMORY, tempdir=None):
+
+    r"""
+    Reassemble a jsonpipe stream via an on-disk store, generating JSON text.
+
+    This gives the same result as :func:`jsonpipe.jsonunpipe` (encoded as
+    ``simplejson.dump`` would), but the tree is built in a temporary SQLite
+    database (in `tempdir`) instead of in memory, and then streamed out in
+    chunks. At most `max_memory` bytes are used for SQLite's page cache, so
+    even unordered input many times larger than RAM can be reassembled:
+
+        >>> def unpipe(s): # Shim for easier demonstration.
+        ...     print ''.join(jsonunpipe_disk(s.strip().splitlines()))
+        >>> unpipe('''
+        ... /\t{}
+        ... /b/1\t"y"
+        ... /a\t[]
+        ... /b/0\t"x"
+        ... /a/1\t{"c": 1}
+        ... /a/x\tundefined
+        ... /b\tundefined''')
+        {"a": [null, {"c": 1}]}
+        >>> unpipe('/\t"abc"')
+        "abc"
+
+    Lines may come in any order at all; a container's children can arrive
+    before the container itself:
+
+        >>> import random
+        >>> from jsonpipe import jsonpipe
+        >>> records = [{"id": i, "tags": ["x", "y"]} for i in range(20)]
+        >>> lines = list(jsonpipe(records))
+        >>> random.Random(1).shuffle(lines)
+        >>> lines.index('/\t[]'), len(lines)
+        (87, 101)
+        >>> output = ''.join(jsonunpipe_disk(lines))
+        >>> simplejson.loads(output) == records
+        True
+    """
+
+    handle, filename = tempfile.mkstemp(suffix='.sqlite3', dir=tempdir)
+    os.close(handle)
+    try:
+        store = NodeStore(filename, max_memory=max_memory)
+        try:
+            for line in lines:
+                path, json = line.rstrip().split('\t')[:2]
+                path = path.split(pathsep)[1:]
+                if json == DELETED:
+                    store.delete(path)
+                else:
+                    store.set(path, decoder.decode(json))
+            for chunk in store.dump():
+                yield chunk
+        finally:
+            store.close()
+    finally:
+        os.remove(filename)
+
+
+class NodeStore(object):
+
+    """A JSON tree held in SQLite, one row per node."""
+
+    ROOT = 0
+
+    def __init__(self, filename, max_memory=MAX_MEMORY):
+        self.db = sqlite3.connect(filename, isolation_level='DEFERRED')
+        self.db.text_factory = str
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('PRAGMA temp_store = FILE')
+        # A negative cache size is a limit in KiB, rather than in pages.
+        self.db.execute('PRAGMA cache_size = %d' %
+                        -max(1, max_memory // 1024))
+        self.db.executescript(SCHEMA)
+        self.db.execute('INSERT INTO nodes (id, value, implied) '
+                        'VALUES (?, ?, 1)', (self.ROOT, '{}'))
+        # (key, id, value) for each component of the last path looked up;
+        # input is usually grouped by path, so most lookups hit this.
+        self.cached = []
+
+    def close(self):
+        self.db.close()
+
+    def set(self, path, obj):
+        if path == ['']:
+            self.cached = []
+            value, implied = self.db.execute(
+                'SELECT value, implied FROM nodes WHERE id = ?',
+                (self.ROOT,)).fetchone()
+            self.assign(self.ROOT, value, implied, obj)
+            return
+
+        parent, parent_value = self.resolve(path[:-1], create=True)
+        self.put(parent, parent_value, path[-1], obj)
+
+    def delete(self, path):
+        if path == ['']:
+            raise ValueError("Cannot delete the root object")
+
+        parent, parent_value = self.resolve(path[:-1], create=False)
+        if parent_value not in ('{}', '[]'):
+            return
+
+        key = path[-1]
+        if parent_value == '[]':
+            if not key.isdigit():
+                # Arrays have no such element, as in lookup().
+                return
+            # Array deletions happen once all input is in (see dump()), so
+            # that indices always refer to their original positions.
+            key = str(int(key))
+            self.db.execute(
+                'INSERT OR IGNORE INTO nodes (parent, key, position) '
+                'VALUES (?, ?, ?)', (parent, key, int(key)))
+            self.db.execute(
+                'UPDATE nodes SET deleted = 1 WHERE parent = ? AND key = ?',
+                (parent, key))
+        else:
+            row = self.db.execute(
+                'SELECT id FROM nodes WHERE parent = ? AND key = ?',
+                (parent, key)).fetchone()
+            if row is not None:
+                self.remove_children(row[0])
+                self.db.execute('DELETE FROM nodes WHERE id = ?', row)
+
+    def root_value(self):
+        return self.db.execute('SELECT value FROM nodes WHERE id = ?',
+                               (self.ROOT,)).fetchone()[0]
+
+    def resolve(self, path, create):
+        """Find the (id, value) of a node, optionally creating its parents."""
+
+        # Skip over the components shared with the last path resolved.
+        depth = 0
+        while (depth < len(path) and depth < len(self.cached) and
+               self.cached[depth][0] == path[depth]):
+            depth += 1
+        del self.cached[depth:]
+        if depth:
+            node, value = self.cached[-1][1:]
+        else:
+            node, value = self.ROOT, self.root_value()
+
+        for key in path[depth:]:
+            if value == '[]':
+                if not key.isdigit() and not create:
+                    return None, None
+                key = str(int(key))
+            elif value != '{}':
+                if not create:
+                    return None, None
+                raise TypeError("Cannot look up %r in a non-container value"
+                                % (key,))
+            row = self.db.execute(
+                'SELECT id, value FROM nodes WHERE parent = ? AND key = ?',
+                (node, key)).fetchone()
+            if row is None or row[1] is None:
+                if not create:
+                    return None, None
+                # All non-existent keys (including those an array has only
+                # been padded up to) are assumed to be an object.
+                row = (self.put(node, value, key, {}, implied=True), '{}')
+            node, value = row
+            self.cached.append((key, node, value))
+        return node, value
+
+    def length(self, node):
+        length, = self.db.execute(
+            'SELECT MAX(position) + 1 FROM nodes '
+            'WHERE parent = ? AND value IS NOT NULL', (node,)).fetchone()
+        return length or 0
+
+    def put(self, parent, parent_value, key, obj, implied=False):
+        position = None
+        if parent_value == '[]':
+            key = str(int(key))
+            position = int(key)
+        elif parent_value != '{}':
+            raise TypeError("Cannot set %r in a non-container value" % (key,))
+
+        row = self.db.execute(
+            'SELECT id, value, implied FROM nodes '
+            'WHERE parent = ? AND key = ?', (parent, key)).fetchone()
+        if row is None:
+            node = self.db.execute(
+                'INSERT INTO nodes (parent, key, position, value, implied) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (parent, key, position, self.encode(obj),
+                 int(implied))).lastrowid
+            self.insert_children(node, obj)
+        else:
+            node = row[0]
+            self.assign(node, row[1], row[2], obj)
+        return node
+
+    def assign(self, node, old_value, implied, obj):
+        """Give an existing node a new value, as jsonunpipe would."""
+
+        value = self.encode(obj)
+        if value in ('{}', '[]') and not obj:
+            # A bare {} or [] gives the type of a node, whose children may
+            # have arrived already.
+            if old_value == value:
+                self.db.execute('UPDATE nodes SET implied = 0 WHERE id = ?',
+                                (node,))
+                return
+            elif implied and value == '[]' and not self.db.execute(
+                    "SELECT 1 FROM nodes WHERE parent = ? AND "
+                    "(key = '' OR key GLOB '*[^0-9]*')", (node,)).fetchone():
+                # Elements which arrived before their array, when it was
+                # taken for an object.
+                self.db.execute(
+                    'UPDATE nodes SET position = CAST(key AS INTEGER), '
+                    'key = CAST(CAST(key AS INTEGER) AS TEXT) '
+                    'WHERE parent = ?', (node,))
+                self.db.execute('UPDATE nodes SET value = ?, implied = 0 '
+                                'WHERE id = ?', (value, node))
+                return
+        self.remove_children(node)
+        self.db.execute('UPDATE nodes SET value = ?, implied = 0 WHERE id = ?',
+                        (value, node))
+        self.insert_children(node, obj)
+
+    def insert_children(self, node, obj):
+        if isinstance(obj, dict):
+            for key, value in obj.iteritems():
+                if isinstance(key, unicode):
+                    key = key.encode('utf-8')
+                self.put(node, '{}', key, value)
+        elif not is_value(obj):
+            for index, value in enumerate(obj):
+                self.put(node, '[]', index, value)
+
+    def remove_children(self, node):
+        self.db.execute(DESCENDANTS + 'DELETE FROM nodes WHERE id IN subtree',
+                        (node,))
+
+    def encode(self, obj):
+        if is_value(obj):
+            return simplejson.dumps(obj)
+        elif isinstance(obj, dict):
+            return '{}'
+        return '[]'
+
+    def dump(self, node=ROOT, value=None):
+        if value is None:
+            value = self.root_value()
+
+        if value == '{}':
+            yield '{'
+            first = True
+            for child, key, child_value in self.db.execute(
+                    'SELECT id, key, value FROM nodes WHERE parent = ? '
+                    'ORDER BY position, id', (node,)):
+                if not first:
+                    yield ', '
+                first = False
+                yield simplejson.dumps(key) + ': '
+                for chunk in self.dump(child, child_value):
+                    yield chunk
+            yield '}'
+
+        elif value == '[]':
+            length = self.length(node)
+            yield '['
+            first = True
+            expected = 0
+            for child, position, child_value, deleted in self.db.execute(
+                    'SELECT id, position, value, deleted FROM nodes '
+                    'WHERE parent = ? AND position < ? ORDER BY position',
+                    (node, length)):
+                # Indices never given are padded with nulls, as jsonunpipe
+                # does; deleted elements are skipped altogether.
+                for _ in xrange(expected, position):
+                    yield 'null' if first else ', null'
+                    first = False
+                expected = position + 1
+                if deleted:
+                    continue
+                if not first:
+                    yield ', '
+                first = False
+                if child_value is None:
+                    yield 'null'
+                    continue
+                for chunk in self.dump(child, child_value):
+                    yield chunk
+            for _ in xrange(expected, length):
+                yield 'null' if first else ', null'
+                first = False
+            yield ']'
+
+        else:
+            yield value
@@ -1,10 +1,26 @@
+import heapq
+import itertools
+
 import simplejson
 
 
-__all__ = ['jsonpipe', 'jsonunpipe']
+__all__ = ['jsonpipe', 'jsonunpipe', 'jsonpatch_lines', 'jsoncolumns',
+           'diff', 'diff_lines']
+
+
+# Containers with more children than this are sorted externally by
+# :func:`canonical`, spilling sorted runs of their output to temporary files.
+RUN_SIZE = 10000
+# The most sorted runs kept open at once before they are merged into one.
+MAX_RUNS = 64
 
+# Right-hand column of a patch line which removes the path on the left.
+# It is not valid JSON, so it can never be mistaken for a value.
+DELETED = 'undefined'
 
-def jsonpipe(obj, pathsep='/', path=()):
+
+def jsonpipe(obj, pathsep='/', path=(), sort_keys=False, max_depth=None,
+             max_items=None, sample=0, seed=None):
 
     r"""
     Generate a jsonpipe stream for the provided (parsed) JSON object.
@@ -95,36 +111,414 @@ def jsonpipe(obj, pathsep='/', path=()):
     The path separator should be a bytestring, and you are advised to use
     something you are almost certain will not be present in your dictionary
     keys.
+
+    Keys are output in the dictionary's own order, unless `sort_keys` is true,
+    in which case the output is in canonical, byte-sorted order (see
+    :func:`canonical`), ready for ``join`` and ``comm``:
+
+        >>> print '\n'.join(jsonpipe({"b": 1, "a": 2}, sort_keys=True))
+        /	{}
+        /a	2
+        /b	1
+
+    To get the shape of a large object without all of its leaves, containers
+    deeper than `max_depth` can be left out, and arrays cut down to their
+    first `max_items` elements (plus `sample` more, picked at random with the
+    given `seed`). Containers whose children are not all output have their
+    number of children in a third column, which :func:`jsonunpipe` ignores:
+
+        >>> pipe = lambda obj, **kwargs: '\n'.join(jsonpipe(obj, **kwargs))
+        >>> print pipe({"a": {"b": [1, 2]}, "c": []}, max_depth=1)
+        /	{}
+        /a	{}	1
+        /c	[]	0
+        >>> print pipe({"a": [1, 2, 3, 4]}, max_items=2)
+        /	{}
+        /a	[]	4
+        /a/0	1
+        /a/1	2
+    """
+
+    if sample:
+        import random
+        generator = random.Random(seed)
+    else:
+        generator = None
+
+    if sort_keys:
+        for line in canonical(obj, pathsep=pathsep, path=path,
+                              max_depth=max_depth, max_items=max_items,
+                              sample=sample, random=generator):
+            yield line
+        return
+
+    for subpath, value in walk(obj, pathsep=pathsep, path=path,
+                               max_depth=max_depth, max_items=max_items,
+                               sample=sample, random=generator):
+        # The depth left below this value, as canonical() would have it.
+        depth = (None if max_depth is None
+                 else max_depth - len(subpath) + len(path))
+        yield format_line(subpath, value, pathsep, depth, max_items, sample)
+
+
+def format_line(path, obj, pathsep, max_depth=None, max_items=None, sample=0):
+    """Format a line of output, with a count if children were left out."""
+
+    result = pathsep + pathsep.join(path) + "\t" + encode(obj)
+    if is_value(obj):
+        return result
+    elif max_depth == 0 or (max_items is not None and
+                            not isinstance(obj, dict) and
+                            len(obj) > max_items + sample):
+        return result + "\t%d" % len(obj)
+    return result
+
+
+def elements(array, max_items=None, sample=0, random=None):
+
     """
+    Select the `(index, element)` pairs of an array to be output.
+
+    These are the first `max_items` elements, followed by `sample` more picked
+    uniformly at random from the rest, in order:
+
+        >>> import random
+        >>> list(elements('abcdefgh', 2))
+        [(0, 'a'), (1, 'b')]
+        >>> list(elements('abcdefgh', 2, sample=2, random=random.Random(3)))
+        [(0, 'a'), (1, 'b'), (3, 'd'), (4, 'e')]
+    """
+
+    if max_items is None or len(array) <= max_items + sample:
+        return enumerate(array)
+    indices = range(max_items)
+    if sample:
+        indices.extend(sorted(random.sample(xrange(max_items, len(array)),
+                                            sample)))
+    return ((index, array[index]) for index in indices)
+
 
-    def output(string):
-        return pathsep + pathsep.join(path) + "\t" + string
+def walk(obj, pathsep='/', path=(), array_key=None, max_depth=None,
+         max_items=None, sample=0, random=None):
+
+    r"""
+    Traverse a (parsed) JSON object, yielding `(path, obj)` pairs.
+
+    This is the traversal underlying :func:`jsonpipe`; the paths are tuples of
+    bytestring keys, and each container is yielded before its children:
+
+        >>> for path, obj in walk({"a": [True]}):
+        ...     print path, obj
+        () {'a': [True]}
+        ('a',) [True]
+        ('a', '0') True
+
+    If `array_key` is given, it is used in place of every array index. This
+    folds all the elements of an array onto a single path:
+
+        >>> [path for path, obj in walk([{"a": 1}, {"a": 2}], array_key='*')]
+        [(), ('*',), ('*', 'a'), ('*',), ('*', 'a')]
+
+    Containers more than `max_depth` levels down are yielded without their
+    children, and only some elements of each array are visited if
+    `max_items` is given (see :func:`elements`).
+    """
 
     if is_value(obj):
-        yield output(simplejson.dumps(obj))
-        raise StopIteration # Stop the generator immediately.
+        yield path, obj
+        return
     elif isinstance(obj, dict):
-        yield output('{}')
         iterator = obj.iteritems()
     elif hasattr(obj, '__iter__'):
-        yield output('[]')
-        iterator = enumerate(obj)
+        iterator = elements(obj, max_items, sample, random)
+        if array_key is not None:
+            iterator = ((array_key, value) for index, value in iterator)
     else:
         raise TypeError("Unsupported type for jsonpipe output: %r" %
                         type(obj))
+    yield path, obj
+    if max_depth == 0:
+        return
 
     for key, value in iterator:
-        # Check the key for sanity.
-        key = to_str(key)
-        if pathsep in key:
-            # In almost any case this is not what the user wants; having
-            # the path separator in the key would create ambiguous output
-            # so we should fail loudly and as quickly as possible.
-            raise ValueError("Path separator %r present in key %r" %
-                             (pathsep, key))
-
-        for line in jsonpipe(value, pathsep=pathsep, path=path + (key,)):
-            yield line
+        key = check_key(key, pathsep)
+        for item in walk(value, pathsep=pathsep, path=path + (key,),
+                         array_key=array_key,
+                         max_depth=(None if max_depth is None
+                                    else max_depth - 1),
+                         max_items=max_items, sample=sample, random=random):
+            yield item
+
+
+def canonical(obj, pathsep='/', path=(), run_size=RUN_SIZE, tempdir=None,
+              max_depth=None, max_items=None, sample=0, random=None):
+
+    r"""
+    Generate jsonpipe output for an object in canonical (byte-sorted) order.
+
+    The lines come out in exactly the order ``LC_ALL=C sort`` would put them,
+    regardless of the order of keys in the object, so two equal objects
+    always give identical output:
+
+        >>> print '\n'.join(canonical({"b": 1, "a-b": 2, "a": {"c": [3]}}))
+        /	{}
+        /a	{}
+        /a-b	2
+        /a/c	[]
+        /a/c/0	3
+        /b	1
+
+    Rather than sorting the output, each container's line is followed by a
+    merge of its (already sorted) children's output, so no more than one
+    line per open child is held at any time.
+
+    Containers with more than `run_size` children are merged a run at a time,
+    each sorted run being spilled to a temporary file (in `tempdir`) before
+    the runs are merged in turn:
+
+        >>> obj = dict(("k%d" % i, i) for i in range(12))
+        >>> list(canonical(obj, run_size=5)) == sorted(jsonpipe(obj))
+        True
+
+    `max_depth`, `max_items` and `sample` limit the output as they do for
+    :func:`jsonpipe`.
+    """
+
+    if is_value(obj):
+        yield format_line(path, obj, pathsep)
+        return
+    elif isinstance(obj, dict):
+        iterator = obj.iteritems()
+    elif hasattr(obj, '__iter__'):
+        iterator = elements(obj, max_items, sample, random)
+    else:
+        raise TypeError("Unsupported type for jsonpipe output: %r" %
+                        type(obj))
+    yield format_line(path, obj, pathsep, max_depth, max_items, sample)
+    if max_depth == 0:
+        return
+
+    def children(count):
+        return [canonical(value, pathsep=pathsep,
+                          path=path + (check_key(key, pathsep),),
+                          run_size=run_size, tempdir=tempdir,
+                          max_depth=(None if max_depth is None
+                                     else max_depth - 1),
+                          max_items=max_items, sample=sample, random=random)
+                for key, value in itertools.islice(iterator, count)]
+
+    streams = children(run_size)
+    following = next(iterator, None)
+    runs = []
+    while following is not None:
+        # Too many children to merge at once: spill this run to disk.
+        runs.append(spill(heapq.merge(*streams), tempdir=tempdir))
+        if len(runs) == MAX_RUNS:
+            runs = [spill(heapq.merge(*runs), tempdir=tempdir)]
+        iterator = itertools.chain([following], iterator)
+        streams = children(run_size)
+        following = next(iterator, None)
+
+    for line in heapq.merge(*(runs + streams)):
+        yield line
+
+
+def spill(lines, tempdir=None):
+    """Write lines to a temporary file, returning an iterator to read them."""
+
+    import tempfile
+
+    run = tempfile.TemporaryFile(dir=tempdir)
+    for line in lines:
+        run.write(line + '\n')
+    run.seek(0)
+    return (line[:-1] for line in run)
+
+
+def diff(old, new, pathsep='/', patch=False):
+
+    r"""
+    Compare two (parsed) JSON objects, generating the paths which differ.
+
+    Both objects are flattened in :func:`canonical` order and the two streams
+    are merge-joined by :func:`diff_lines`, so key order makes no difference.
+    Removed paths are prefixed with ``-``, added paths with ``+``, and changed
+    paths with ``~`` (followed by the old value, a tab, and the new value):
+
+        >>> def pdiff(old, new, **kwargs): # Shim for easier demonstration.
+        ...     print '\n'.join(diff(old, new, **kwargs))
+        >>> pdiff({"a": 1, "b": {"c": 2}, "d": [1, 2]},
+        ...       {"d": [1, 3, 4], "a": 1, "e": True})
+        -/b	{}
+        -/b/c	2
+        ~/d/1	2	3
+        +/d/2	4
+        +/e	true
+
+    With ``patch=True``, the result is a jsonpipe stream which will turn the
+    old object into the new one. Removed paths have :data:`DELETED` as their
+    value, and the descendants of removed or replaced containers are omitted:
+
+        >>> pdiff({"a": {"b": 1}, "c": {"d": 2}}, {"a": 5}, patch=True)
+        /a	5
+        /c	undefined
+        >>> pdiff({"a": {"0": 1, "1": 2}}, {"a": [1]}, patch=True)
+        /a	[]
+        /a/0	1
+
+    The comparison holds only one line from each side at a time, but the
+    objects themselves must be in memory. To compare documents too large for
+    that, flatten them in canonical order first (e.g. with ``jsonpipe
+    --sort-keys``) and compare the lines with :func:`diff_lines` instead.
+    """
+
+    return diff_lines(canonical(old, pathsep=pathsep),
+                      canonical(new, pathsep=pathsep),
+                      pathsep=pathsep, patch=patch)
+
+
+def diff_lines(old_lines, new_lines, pathsep='/', patch=False):
+
+    r"""
+    Compare two jsonpipe streams in canonical order, as :func:`diff` does.
+
+    The lines must be in the order :func:`canonical` gives them (as do
+    ``jsonpipe --sort-keys`` and ``LC_ALL=C sort``), with or without their
+    newlines. Only one line from each side is held at a time, so streams of
+    any size can be compared:
+
+        >>> old = ['/\t{}\n', '/a\t1\n', '/b\t2\n']
+        >>> new = ['/\t{}\n', '/a\t3\n', '/c\t4\n']
+        >>> for line in diff_lines(old, new):
+        ...     print line
+        ~/a	1	3
+        -/b	2
+        +/c	4
+
+    Lines out of order would give a wrong result, so are an error:
+
+        >>> list(diff_lines(['/\t{}', '/b\t1', '/a\t2'], []))
+        Traceback (most recent call last):
+        ...
+        ValueError: Line 3 of the old stream is out of order: '/a\t2'
+    """
+
+    def split(lines, side):
+        previous = ''
+        for number, line in enumerate(lines, 1):
+            line = line.rstrip('\n')
+            if '\t' not in line:
+                raise ValueError("Line %d of the %s stream is not jsonpipe "
+                                 "output: %r" % (number, side, line))
+            path, value = line.split('\t', 1)
+            # The tab makes a path sort before all of its descendants,
+            # matching the order of the lines themselves.
+            key = path + '\t'
+            if key < previous:
+                raise ValueError("Line %d of the %s stream is out of order: "
+                                 "%r" % (number, side, line))
+            previous = key
+            yield key, value
+
+    def sentinel():
+        return None, None
+
+    def prefix(key):
+        path = key[:-1]
+        return path if path == pathsep else path + pathsep
+
+    def replaced(key):
+        # Is this key under a container already removed or replaced by the
+        # patch? The prefixes are pruned as the (sorted) keys pass them.
+        gone[:] = [p for p in gone if key.startswith(p) or key < p]
+        return any(key.startswith(p) for p in gone)
+
+    old_lines = split(old_lines, 'old')
+    new_lines = split(new_lines, 'new')
+    old_key, old_value = next(old_lines, sentinel())
+    new_key, new_value = next(new_lines, sentinel())
+    # Prefixes of the containers removed or replaced so far by the patch.
+    gone = []
+
+    while old_key is not None or new_key is not None:
+        if new_key is None or (old_key is not None and old_key < new_key):
+            if not patch:
+                yield '-' + old_key + old_value
+            elif not replaced(old_key):
+                yield old_key + DELETED
+                gone.append(prefix(old_key))
+            old_key, old_value = next(old_lines, sentinel())
+        elif old_key is None or new_key < old_key:
+            yield ('' if patch else '+') + new_key + new_value
+            new_key, new_value = next(new_lines, sentinel())
+        else:
+            if patch and replaced(new_key):
+                # The old container has been swapped for a new one, so
+                # even unchanged descendants must be written out again.
+                yield new_key + new_value
+            elif old_value != new_value:
+                if patch:
+                    yield new_key + new_value
+                    if old_value in ('{}', '[]'):
+                        gone.append(prefix(old_key))
+                else:
+                    yield '~' + new_key + old_value + '\t' + new_value
+            old_key, old_value = next(old_lines, sentinel())
+            new_key, new_value = next(new_lines, sentinel())
+
+
+def jsoncolumns(records, columns, pathsep='/'):
+
+    r"""
+    Generate one tab-separated row per record, holding the requested columns.
+
+    Each column is a path beginning with ``*``, which stands in for the record
+    itself. Values are encoded just as they are in the right-hand column of
+    :func:`jsonpipe`, and missing values are left empty:
+
+        >>> records = [{"id": 1, "user": {"name": "foo"}},
+        ...            {"id": 2, "user": {"name": "bar", "tags": ["x"]}},
+        ...            {"id": 3}]
+        >>> for row in jsoncolumns(records, ['/*/id', '/*/user/name',
+        ...                                  '/*/user/tags/0', '/*/user']):
+        ...     print repr(row)
+        '1\t"foo"\t\t{}'
+        '2\t"bar"\t"x"\t{}'
+        '3\t\t\t'
+
+    Only the requested paths are looked up; nothing else in a record is
+    visited. Column paths must start with the record wildcard:
+
+        >>> list(jsoncolumns(records, ['/id']))
+        Traceback (most recent call last):
+        ...
+        ValueError: Column '/id' does not start with '/*'
+
+    Like jsonpipe paths, columns are UTF-8, and may name keys which some
+    records lack:
+
+        >>> records = [{u"caf\xe9": 1}, {u"a": 2}]
+        >>> for row in jsoncolumns(records, ['/*/caf\xc3\xa9', '/*/a']):
+        ...     print repr(row)
+        '1\t'
+        '\t2'
+    """
+
+    paths = []
+    for column in columns:
+        components = column.split(pathsep)
+        if components[:2] != ['', '*']:
+            raise ValueError("Column %r does not start with %r" %
+                             (column, pathsep + '*'))
+        paths.append([component for component in components[2:]
+                      if component])
+
+    for record in records:
+        row = []
+        for path in paths:
+            node = lookup(record, path)
+            row.append('' if node is MISSING else encode(node))
+        yield '\t'.join(row)
 
 
 def jsonunpipe(lines, pathsep='/', discard='',
@@ -174,38 +568,272 @@ def jsonunpipe(lines, pathsep='/', discard='',
         >>> unpipe('''
         ... /a/b/c\t123''')
         {'a': {'b': {'c': 123}}}
+
+    Array elements need not arrive in order, so sorted output can be read back
+    in; any gaps are filled with nulls until they are given::
+
+        >>> unpipe('''
+        ... /\t[]
+        ... /2\t"c"
+        ... /0\t"a"''')
+        ['a', None, 'c']
+
+    Indeed, lines may arrive in any order at all (say, from ``shuf``); a
+    container's children can come before the container itself::
+
+        >>> unpipe('''
+        ... /0/b\t[]
+        ... /1/a\t2
+        ... /0/b/0\t"x"
+        ... /\t[]
+        ... /0\t{}''')
+        [{'b': ['x']}, {'a': 2}]
+    """
+
+    return jsonpatch_lines(decoder.decode('{}'), lines, pathsep=pathsep,
+                           decoder=decoder, implied_root=True)
+
+
+def jsonpatch_lines(base, lines, pathsep='/',
+                    decoder=simplejson._default_decoder, implied_root=False):
+
+    r"""
+    Apply a stream of jsonpipe lines to an existing (parsed) JSON object.
+
+    Each line sets the value at its path, modifying `base` in place; only the
+    paths mentioned are visited, so the cost depends on the size of the patch
+    and not the size of the document. The patched object is returned:
+
+        >>> doc = {'a': {'b': 1, 'c': [1, 2]}, 'd': 'x'}
+        >>> jsonpatch_lines(doc, ['/a/b\t2', '/a/c/2\t3', '/e/f\ttrue'])
+        {'a': {'c': [1, 2, 3], 'b': 2}, 'e': {'f': True}, 'd': 'x'}
+        >>> doc['a']['b']
+        2
+
+    A value of :data:`DELETED` (``undefined``) removes a path instead. To keep
+    the indices in a patch referring to the original positions, array
+    elements are only removed once every line has been applied (highest index
+    first):
+
+        >>> jsonpatch_lines({'a': [0, 1, 2, 3], 'b': 1},
+        ...                 ['/a/1\tundefined', '/a/2\tundefined', '/a/3\t"3"',
+        ...                  '/b\tundefined', '/c\tundefined'])
+        {'a': [0, '3']}
+        >>> jsonpatch_lines([0, 1, 2], ['/1\tundefined', '/1\tundefined'])
+        [0, 2]
+
+    Deleting a path which isn't there does nothing:
+
+        >>> jsonpatch_lines({'a': [0]}, ['/a/x\tundefined', '/a/1\tundefined',
+        ...                              '/b/c\tundefined'])
+        {'a': [0]}
+
+    The root path replaces the whole object, and so must not be deleted:
+
+        >>> jsonpatch_lines({'a': 1}, ['/\t[]', '/0\t"x"'])
+        ['x']
+        >>> jsonpatch_lines({'a': 1}, ['/\tundefined'])
+        Traceback (most recent call last):
+        ...
+        ValueError: Cannot delete the root object
+
+    A bare ``{}`` or ``[]`` only gives the type of its path, keeping any
+    children of that type already there, so lines may come in any order. If
+    `implied_root` is true (as it is for :func:`jsonunpipe`), `base` is only a
+    placeholder, and becomes an array if the root turns out to be one:
+
+        >>> jsonpatch_lines({}, ['/1/a\t1', '/1\t{}', '/\t[]'],
+        ...                 implied_root=True)
+        [None, {'a': 1}]
+
+    Paths are UTF-8, and find the Unicode keys of a parsed document:
+
+        >>> jsonpatch_lines({u'caf\xe9': {u'x': 1, u'y': 2}},
+        ...                 ['/caf\xc3\xa9/x\tundefined', '/caf\xc3\xa9/y\t3'])
+        {u'caf\xe9': {u'y': 3}}
     """
 
     def parse_line(line):
-        path, json = line.rstrip().split('\t')
+        # Any further columns (such as the counts from jsonpipe's max_depth
+        # and max_items) are ignored.
+        path, json = line.rstrip().split('\t')[:2]
+        if json == DELETED:
+            return path.split(pathsep)[1:], MISSING
         return path.split(pathsep)[1:], decoder.decode(json)
 
+    def implied_object():
+        obj = decoder.decode('{}')
+        implied[id(obj)] = obj
+        return obj
+
+    def padded(obj, index):
+        return index in padding.get(id(obj), (None, ()))[1]
+
+    def merge(existing, value):
+        # A bare {} or [] line gives the type of a node, whose children may
+        # already have arrived (so are kept), or may yet arrive.
+        if existing is MISSING or is_value(value) or value:
+            return value
+        elif isinstance(existing, dict) and isinstance(value, dict):
+            implied.pop(id(existing), None)
+            return existing
+        elif isinstance(existing, list) and isinstance(value, list):
+            return existing
+        elif (id(existing) in implied and isinstance(value, list) and
+              all(key.isdigit() for key in existing)):
+            # Elements arrived before their array; it was taken for an
+            # object until now.
+            del implied[id(existing)]
+            for index in sorted(existing, key=int):
+                setitem(value, index, existing[index])
+        return value
+
     def getitem(obj, index):
         if isinstance(obj, (list, tuple)):
-            return obj[int(index)]
+            index = int(index)
+            if index >= len(obj) or padded(obj, index):
+                setitem(obj, index, implied_object())
+            return obj[index]
         # All non-existent keys are assumed to be an object.
+        index = dict_key(obj, index)
         if index not in obj:
-            obj[index] = decoder.decode('{}')
+            obj[index] = implied_object()
         return obj[index]
 
     def setitem(obj, index, value):
         if isinstance(obj, list):
             index = int(index)
-            if len(obj) == index:
-                obj.append(value)
+            if len(obj) <= index:
+                # Indices may arrive out of order (e.g. from sorted output),
+                # so pad the array with nulls until they turn up.
+                padding.setdefault(id(obj), (obj, set()))[1].update(
+                    xrange(len(obj), index))
+                obj.extend([None] * (index - len(obj)))
+                obj.append(merge(MISSING, value))
+                return
+            elif padded(obj, index):
+                padding[id(obj)][1].discard(index)
+                obj[index] = merge(MISSING, value)
                 return
-        obj[index] = value
+        else:
+            index = dict_key(obj, index)
+        obj[index] = merge(obj.get(index, MISSING) if isinstance(obj, dict)
+                           else obj[index], value)
 
-    output = decoder.decode('{}')
+    def delitem(obj, index):
+        if isinstance(obj, list):
+            # Deleting the same element twice must not take its successor.
+            if index.isdigit():
+                deletions[int(index), id(obj)] = obj
+        else:
+            obj.pop(dict_key(obj, index), None)
+
+    output = base
+    deletions = {}
+    # Objects created for paths never given a line of their own, and the
+    # nulls padding arrays (by id, along with the object itself).
+    implied = {id(base): base} if implied_root else {}
+    padding = {}
     for line in lines:
         path, obj = parse_line(line)
         if path == ['']:
-            output = obj
-            continue
-        setitem(reduce(getitem, path[:-1], output), path[-1], obj)
+            if obj is MISSING:
+                raise ValueError("Cannot delete the root object")
+            output = merge(output, obj)
+        elif obj is MISSING:
+            parent = lookup(output, path[:-1])
+            if parent is not MISSING and not is_value(parent):
+                delitem(parent, path[-1])
+        else:
+            setitem(reduce(getitem, path[:-1], output), path[-1], obj)
+
+    for (index, _), obj in sorted(deletions.iteritems(), reverse=True):
+        if index < len(obj):
+            del obj[index]
     return output
 
 
+MISSING = object()
+
+
+def dict_key(obj, key):
+    """Find `key` in a dict, whose keys may be Unicode where ours are UTF-8."""
+
+    if key not in obj and isinstance(key, str):
+        unicode_key = key.decode('utf-8')
+        if unicode_key in obj:
+            return unicode_key
+    return key
+
+
+def lookup(obj, path):
+
+    """
+    Follow a sequence of keys/indices into a (parsed) JSON object.
+
+    Returns :data:`MISSING` if any part of the path is absent. The keys are
+    UTF-8 bytestrings, as in jsonpipe paths, but match Unicode keys too:
+
+        >>> lookup({"a": [1, {"b": 2}]}, ['a', '1', 'b'])
+        2
+        >>> lookup({"a": [1]}, ['a', '3']) is MISSING
+        True
+        >>> lookup({u"caf\xe9": 1}, ['caf\xc3\xa9'])
+        1
+    """
+
+    for key in path:
+        if isinstance(obj, dict):
+            obj = obj.get(dict_key(obj, key), MISSING)
+        elif isinstance(obj, (list, tuple)) and key.isdigit():
+            index = int(key)
+            obj = obj[index] if index < len(obj) else MISSING
+        else:
+            return MISSING
+        if obj is MISSING:
+            return MISSING
+    return obj
+
+
+def check_key(key, pathsep):
+
+    """
+    Coerce a key to a bytestring, checking it for the path separator.
+
+        >>> check_key(u"abc", '/')
+        'abc'
+        >>> check_key("a/b", '/')
+        Traceback (most recent call last):
+        ...
+        ValueError: Path separator '/' present in key 'a/b'
+    """
+
+    key = to_str(key)
+    if pathsep in key:
+        # In almost any case this is not what the user wants; having
+        # the path separator in the key would create ambiguous output
+        # so we should fail loudly and as quickly as possible.
+        raise ValueError("Path separator %r present in key %r" %
+                         (pathsep, key))
+    return key
+
+
+def encode(obj):
+
+    """
+    Encode a single node as it appears in the right-hand column of jsonpipe.
+
+        >>> encode({"a": 1}), encode([1]), encode(u"abc"), encode(None)
+        ('{}', '[]', '"abc"', 'null')
+    """
+
+    if is_value(obj):
+        return simplejson.dumps(obj)
+    elif isinstance(obj, dict):
+        return '{}'
+    return '[]'
+
+
 def to_str(obj):
 
     ur"""
@@ -0,0 +1,247 @@
+"""
+A long-running server which keeps jsonpipe loaded for ``jsonpipe-client``.
+
+Each request is handled in a child process forked from the server, so it
+starts with every module already imported, and can freely take over
+``sys.argv`` and the standard streams for the duration of the command.
+"""
+
+import os
+import signal
+import socket
+import SocketServer
+import sys
+import traceback
+
+import argparse
+
+import jsonpipe.cli
+import jsonpipe.disk
+import jsonpipe.summary
+from jsonpipe_client import (SOCKET, FRAME_HEADER, STDOUT, STDERR, EXIT,
+                             BUFFER_SIZE, check_socket)
+
+
+__all__ = ['make_server', 'serve', 'main']
+
+
+# The console scripts which can be run by the server, and their parsers.
+COMMANDS = {
+    'jsonpipe': (jsonpipe.cli.main, jsonpipe.cli.PARSER),
+    'jsonunpipe': (jsonpipe.cli.main_unpipe, jsonpipe.cli.UNPIPE_PARSER),
+    'jsonpipe-diff': (jsonpipe.cli.main_diff, jsonpipe.cli.DIFF_PARSER),
+}
+
+
+class FrameWriter(object):
+
+    """A file-like object which sends everything written as framed data."""
+
+    softspace = 0
+
+    def __init__(self, wfile, channel):
+        self.wfile = wfile
+        self.channel = channel
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.size:
+            data = ''.join(self.buffer)
+            self.wfile.write(FRAME_HEADER.pack(self.channel, len(data)) + data)
+        self.buffer = []
+        self.size = 0
+
+    def isatty(self):
+        return False
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            header = self.rfile.readline()
+            if not header.strip().isdigit():
+                # Not a client request (e.g. make_server() probing).
+                return
+            request = self.rfile.read(int(header)).split('\0')
+            stdout = FrameWriter(self.wfile, STDOUT)
+            stderr = FrameWriter(self.wfile, STDERR)
+            status = run(request[1:], request[0], self.rfile, stdout, stderr)
+            stdout.flush()
+            stderr.flush()
+            self.wfile.write(FRAME_HEADER.pack(EXIT, len(str(status))) +
+                             str(status))
+        except socket.error:
+            # The client has gone away; there's nobody left to tell.
+            pass
+
+
+def run(argv, cwd, stdin, stdout, stderr):
+
+    """
+    Run a command as its console script would, returning the exit status.
+
+    This replaces the process' working directory, arguments and standard
+    streams, so it must only be called in a (forked) child process.
+    """
+
+    if not argv or argv[0] not in COMMANDS:
+        stderr.write("jsonpipe-server: unknown command %r\n" %
+                     (argv[0] if argv else '',))
+        return 2
+    function, parser = COMMANDS[argv[0]]
+    parser.prog = argv[0]
+
+    os.chdir(cwd)
+    sys.argv = argv
+    sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+    try:
+        function()
+    except SystemExit, exc:
+        if exc.code is None:
+            return 0
+        elif isinstance(exc.code, (int, long)):
+            return exc.code
+        stderr.write('%s\n' % (exc.code,))
+        return 1
+    except socket.error:
+        # The client has gone away; leave it to the handler.
+        raise
+    except Exception:
+        traceback.print_exc(file=stderr)
+        return 1
+    return 0
+
+
+class Server(SocketServer.ForkingMixIn, SocketServer.UnixStreamServer):
+    pass
+
+
+def make_server(path=SOCKET):
+
+    r"""
+    Create a server listening on the Unix socket at `path`.
+
+    The socket is only accessible to the current user, and its directory is
+    created (private to the current user) if need be. A leftover socket file
+    is replaced, unless another server is still listening on it.
+
+        >>> import os, tempfile, threading
+        >>> from StringIO import StringIO
+        >>> from jsonpipe_client import call
+        >>> path = os.path.join(tempfile.mkdtemp(), 'run', 'jsonpipe.sock')
+        >>> server = make_server(path)
+        >>> thread = threading.Thread(target=server.serve_forever)
+        >>> thread.daemon = True
+        >>> thread.start()
+
+        >>> stdout, stderr = StringIO(), StringIO()
+        >>> call(['jsonpipe'], StringIO('{"a": [1]}'), stdout, stderr,
+        ...      path=path)
+        0
+        >>> print stdout.getvalue()
+        /	{}
+        /a	[]
+        /a/0	1
+        >>> call(['jsonpipe', '--bogus'], StringIO(''), stdout, stderr,
+        ...      path=path)
+        2
+        >>> print stderr.getvalue()
+        usage: jsonpipe ...
+        jsonpipe: error: unrecognized arguments: --bogus
+
+        >>> make_server(path)
+        Traceback (most recent call last):
+        ...
+        ValueError: A server is already listening on ...
+        >>> oct(os.stat(os.path.dirname(path)).st_mode & 0777)
+        '0700'
+        >>> server.shutdown()
+        >>> server.server_close()
+        >>> os.remove(path)
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.remove(path)
+        else:
+            # Shut down rather than just close, in case the handler for this
+            # connection was forked while our end was still open.
+            probe.shutdown(socket.SHUT_RDWR)
+            raise ValueError("A server is already listening on %s" % (path,))
+        finally:
+            probe.close()
+
+    umask = os.umask(0077)
+    try:
+        server = Server(path, RequestHandler)
+    finally:
+        os.umask(umask)
+    try:
+        # Clients would refuse to connect anyway.
+        check_socket(path)
+    except socket.error, exc:
+        server.server_close()
+        os.remove(path)
+        raise ValueError(exc.strerror)
+    return server
+
+
+def serve(path=SOCKET):
+    """Serve requests on the Unix socket at `path` until interrupted."""
+
+    server = make_server(path)
+    pid = os.getpid()
+
+    def terminate(signum, frame):
+        if os.getpid() != pid:
+            # A child handling a request; die just as it would have.
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        raise SystemExit(128 + signum)
+
+    handler = signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        server.server_close()
+        os.remove(path)
+
+
+PARSER = argparse.ArgumentParser(
+    description="Keep jsonpipe loaded, to serve requests from "
+                "jsonpipe-client.")
+PARSER.add_argument('--socket', metavar='PATH', default=SOCKET,
+                    help="The Unix socket to listen on (default: %(default)s)")
+
+
+def main():
+    args = PARSER.parse_args()
+    try:
+        serve(args.socket)
+    except ValueError, exc:
+        PARSER.error(str(exc))
@@ -0,0 +1,413 @@
+"""
+Transparently (de)compressed input and output files for the command line.
+
+Compressed input is recognised by its magic bytes and decompressed in a
+background thread, and compressed output is compressed in a background
+thread; in both cases large chunks are passed to and from the thread, so that
+(de)compression overlaps with the traversal rather than running in a separate
+process behind a small pipe buffer.
+
+The compression and threading modules are only imported once a file needs
+them, so that reading a plain file costs nothing extra at startup.
+"""
+
+import os
+import stat
+import sys
+
+
+__all__ = ['open_input', 'open_output']
+
+
+CHUNK_SIZE = 1024 * 1024
+# The most chunks held between a background thread and the main one.
+QUEUE_SIZE = 8
+# How much compressed data is given to bz2 and lzma at a time; unlike zlib,
+# they can't be told to stop once they've produced a chunk of output.
+INPUT_SLICE = 64 * 1024
+# How long (in seconds) closing a reader waits for its thread to stop. Only a
+# thread stuck reading from a stalled pipe takes longer, and is left to it.
+STOP_TIMEOUT = 0.1
+
+MAGIC = [('gzip', '\x1f\x8b'), ('bzip2', 'BZh'), ('xz', '\xfd7zXZ\x00')]
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bzip2', '.xz': 'xz'}
+
+
+def detect(prefix):
+
+    r"""
+    Identify the compression format of a file from its first few bytes.
+
+    Returns the name of the format, None for uncompressed data, or False if
+    more bytes are needed to tell:
+
+        >>> detect('\x1f\x8b\x08'), detect('BZh9'), detect('{"a": 1}')
+        ('gzip', 'bzip2', None)
+        >>> detect('\xfd7z')
+        False
+    """
+
+    for name, magic in MAGIC:
+        if prefix.startswith(magic):
+            return name
+    for name, magic in MAGIC:
+        if magic.startswith(prefix):
+            return False
+    return None
+
+
+def decompressor(name):
+    if name == 'gzip':
+        import zlib
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif name == 'bzip2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    import lzma
+    return lzma.LZMADecompressor()
+
+
+def decompress(stream, data):
+
+    r"""
+    Decompress some of `data`, returning the output and the data left over.
+
+    The output is kept to about :data:`CHUNK_SIZE`, however well the data was
+    compressed:
+
+        >>> c = compressor('gzip')
+        >>> data = c.compress('x' * (3 * CHUNK_SIZE)) + c.flush()
+        >>> stream, sizes = decompressor('gzip'), []
+        >>> while data:
+        ...     output, data = decompress(stream, data)
+        ...     sizes.append(len(output))
+        >>> sizes == [CHUNK_SIZE] * 3
+        True
+    """
+
+    if hasattr(stream, 'unconsumed_tail'):
+        return stream.decompress(data, CHUNK_SIZE), stream.unconsumed_tail
+    return stream.decompress(data[:INPUT_SLICE]), data[INPUT_SLICE:]
+
+
+def compressor(name):
+    if name == 'gzip':
+        import zlib
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif name == 'bzip2':
+        import bz2
+        return bz2.BZ2Compressor()
+    import lzma
+    return lzma.LZMACompressor()
+
+
+def check_supported(name):
+    if name == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            raise IOError("xz compression needs the lzma module, which this "
+                          "Python does not have")
+
+
+def open_input(path='-'):
+
+    """
+    Open a file (or stdin, for ``-``) for reading, decompressing if needed.
+
+    Uncompressed regular files are returned as they are; anything else
+    (including pipes, which can't be rewound once the start has been read to
+    detect compression) is read through a :class:`ThreadedReader`:
+
+        >>> import os, shutil, tempfile, threading
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'fifo')
+        >>> os.mkfifo(path)
+        >>> writer = threading.Thread(
+        ...     target=lambda: open(path, 'w').write('{"a": 1}\n'))
+        >>> writer.start()
+        >>> input = open_input(path)
+        >>> input.read()
+        '{"a": 1}\n'
+        >>> input.close()
+        >>> writer.join()
+        >>> shutil.rmtree(directory)
+    """
+
+    raw = sys.stdin if path == '-' else open(path, 'rb')
+    regular = False
+    if isinstance(raw, file):
+        # Don't block waiting for a full chunk from a pipe; take what's there.
+        fd = raw.fileno()
+        read = lambda: os.read(fd, CHUNK_SIZE)
+        regular = stat.S_ISREG(os.fstat(fd).st_mode)
+    else:
+        read = lambda: raw.read(CHUNK_SIZE)
+
+    prefix = ''
+    name = False
+    while name is False:
+        data = read()
+        if not data:
+            name = None
+            break
+        prefix += data
+        name = detect(prefix)
+
+    close = None if raw is sys.stdin else raw.close
+    if name is None:
+        if close is not None and regular:
+            raw.seek(0)
+            return raw
+        return ThreadedReader(read, prefix=prefix, close=close)
+    check_supported(name)
+    return ThreadedReader(read, name, prefix=prefix, close=close,
+                          path=None if raw is sys.stdin else path)
+
+
+def open_output(path='-'):
+
+    """
+    Open a file (or stdout, for ``-``) for writing.
+
+    Files ending in ``.gz``, ``.bz2`` or ``.xz`` are compressed accordingly by
+    a :class:`ThreadedWriter`.
+    """
+
+    if path == '-':
+        return sys.stdout
+    name = EXTENSIONS.get(os.path.splitext(path)[1])
+    if name is None:
+        return open(path, 'wb')
+    check_supported(name)
+    return ThreadedWriter(open(path, 'wb'), name)
+
+
+class Failure(object):
+
+    """Wraps an exception raised in a background thread."""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+    def reraise(self):
+        raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+
+class ThreadedReader(object):
+
+    r"""
+    A read-only file whose data is produced by a background thread.
+
+    `read` is called repeatedly for raw data until it returns an empty string.
+    If a compression format is named, the data is decompressed (including
+    concatenated streams, as ``zcat`` does) before it is handed over:
+
+        >>> def compressed(s):
+        ...     c = compressor('gzip')
+        ...     return c.compress(s) + c.flush()
+        >>> chunks = iter([compressed('{"a": 1}\n{"b"'), compressed(': 2}\n')])
+        >>> reader = ThreadedReader(lambda: next(chunks, ''), 'gzip')
+        >>> reader.readline()
+        '{"a": 1}\n'
+        >>> list(reader)
+        ['{"b": 2}\n']
+        >>> reader.read()
+        ''
+
+    `close` is called by the background thread once it has stopped reading,
+    which it does at the end of the data or as soon as the reader is closed:
+
+        >>> import threading
+        >>> closed = threading.Event()
+        >>> reader = ThreadedReader(lambda: 'x' * 10, close=closed.set)
+        >>> reader.read(15)
+        'xxxxxxxxxxxxxxx'
+        >>> reader.close()
+        >>> closed.wait(5)
+        True
+
+    Data which can't be decompressed raises :exc:`IOError`, naming `path` if
+    it's given:
+
+        >>> chunks = iter(['\x1f\x8b\x08\x00' + 'junk' * 4])
+        >>> reader = ThreadedReader(lambda: next(chunks, ''), 'gzip',
+        ...                         path='data.json.gz')
+        >>> reader.read()
+        Traceback (most recent call last):
+        ...
+        IOError: Invalid gzip data in data.json.gz (Error -3 while ...)
+    """
+
+    def __init__(self, read, name=None, prefix='', close=None, path=None):
+        import Queue
+        import threading
+
+        self.queue = Queue.Queue(QUEUE_SIZE)
+        # Unread data is buffer[offset:]; lines are sliced out of the buffer
+        # without copying the rest of it each time.
+        self.buffer = ''
+        self.offset = 0
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fill,
+                                       args=(read, name, prefix, close, path))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fill(self, read, name, prefix, close, path):
+        # Only this thread reads from (and closes) the file, so it can never
+        # read from a descriptor which has been closed and reused elsewhere.
+        try:
+            stream = decompressor(name) if name else None
+            data = prefix or read()
+            while data and not self.stopped.is_set():
+                if stream is None:
+                    self.queue.put(data)
+                else:
+                    while data and not self.stopped.is_set():
+                        try:
+                            output, rest = decompress(stream, data)
+                        except EOFError:
+                            # The last stream ended with the previous chunk.
+                            stream = decompressor(name)
+                            continue
+                        except Exception, exc:
+                            # Report corrupt data like any other problem with
+                            # the file, rather than as a codec's own error.
+                            raise IOError("Invalid %s data%s (%s)" % (
+                                name, ' in %s' % (path,) if path else '', exc))
+                        if output:
+                            self.queue.put(output)
+                        if stream.unused_data:
+                            # Another stream follows the one just finished.
+                            rest = stream.unused_data + rest
+                            stream = decompressor(name)
+                        data = rest
+                data = read()
+            self.queue.put(None)
+        except Exception:
+            self.queue.put(Failure(sys.exc_info()))
+        finally:
+            if close is not None:
+                close()
+
+    def next_chunk(self):
+        if self.finished:
+            return ''
+        chunk = self.queue.get()
+        if chunk is None:
+            self.finished = True
+            return ''
+        elif isinstance(chunk, Failure):
+            self.finished = True
+            chunk.reraise()
+        return chunk
+
+    def read(self, size=-1):
+        chunks = [self.buffer[self.offset:]]
+        length = len(chunks[0])
+        while size < 0 or length < size:
+            chunk = self.next_chunk()
+            if not chunk:
+                if self.finished:
+                    break
+                continue
+            chunks.append(chunk)
+            length += len(chunk)
+        data = ''.join(chunks)
+        self.offset = 0
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+    def readline(self):
+        chunks = []
+        while True:
+            index = self.buffer.find('\n', self.offset)
+            if index >= 0:
+                chunks.append(self.buffer[self.offset:index + 1])
+                self.offset = index + 1
+                break
+            chunks.append(self.buffer[self.offset:])
+            self.buffer, self.offset = self.next_chunk(), 0
+            if not self.buffer and self.finished:
+                break
+        return ''.join(chunks)
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        self.stopped.set()
+        self.finished = True
+        # Make room for the background thread to finish any chunk it's
+        # putting, after which it sees that it has been stopped. (Nothing
+        # else takes from the queue, so it can't empty under our feet.)
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        # Don't leave it running, or it may wake up while the interpreter is
+        # exiting (and complain that the modules it uses have gone).
+        self.thread.join(STOP_TIMEOUT)
+
+
+class ThreadedWriter(object):
+
+    """A write-only file, compressed and written by a background thread."""
+
+    softspace = 0
+
+    def __init__(self, raw, name):
+        import Queue
+        import threading
+
+        self.raw = raw
+        self.queue = Queue.Queue(QUEUE_SIZE)
+        self.buffer = []
+        self.size = 0
+        self.failure = None
+        self.thread = threading.Thread(target=self.drain,
+                                       args=(compressor(name),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def drain(self, stream):
+        try:
+            for chunk in iter(self.queue.get, None):
+                self.raw.write(stream.compress(chunk))
+            self.raw.write(stream.flush())
+        except Exception:
+            self.failure = Failure(sys.exc_info())
+            # Keep taking chunks, so that the writer never blocks on us.
+            for chunk in iter(self.queue.get, None):
+                pass
+
+    def write(self, data):
+        if self.failure is not None:
+            self.failure.reraise()
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= CHUNK_SIZE:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.size:
+            self.queue.put(''.join(self.buffer))
+        self.buffer = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.raw.close()
+        if self.failure is not None:
+            self.failure.reraise()
@@ -0,0 +1,174 @@
+import hashlib
+import math
+import struct
+
+import simplejson
+
+from pipe import walk, encode
+
+
+__all__ = ['summarize', 'summary_lines', 'PathStats', 'HyperLogLog']
+
+
+def summarize(obj, pathsep='/', stats=None, precision=10):
+
+    r"""
+    Collect per-path statistics for a (parsed) JSON object in a single pass.
+
+    Array indices are folded into ``*``, so every element of an array
+    contributes to the same paths. The result is an ordered mapping of path to
+    :class:`PathStats`, in order of first appearance:
+
+        >>> stats = summarize([{"id": 1, "name": "foo"},
+        ...                    {"id": 7, "name": "quux"},
+        ...                    {"id": None}])
+        >>> stats.keys()
+        ['/', '/*', '/*/id', '/*/name']
+        >>> for line in summary_lines(stats):
+        ...     print line
+        /	{"count": 1, "types": {"array": 1}}
+        /*	{"count": 3, "types": {"object": 3}}
+        /*/id	{"count": 3, "types": {"number": 2, "null": 1}, "min": 1, "max": 7, "distinct": 3}
+        /*/name	{"count": 2, "types": {"string": 2}, "min_length": 3, "max_length": 4, "mean_length": 3.5, "distinct": 2}
+
+    To summarize several documents (e.g. a stream of newline-delimited JSON),
+    pass the mapping from one call in as `stats` to the next:
+
+        >>> stats = summarize({"a": "x"})
+        >>> stats = summarize({"a": "y"}, stats=stats)
+        >>> stats['/a'].count
+        2
+
+    Distinct counts are estimated with a :class:`HyperLogLog` sketch of
+    ``2 ** precision`` registers, so memory use is bounded per path no matter
+    how many values are seen.
+    """
+
+    if stats is None:
+        stats = simplejson.OrderedDict()
+    for path, node in walk(obj, pathsep=pathsep, array_key='*'):
+        key = pathsep + pathsep.join(path)
+        if key not in stats:
+            stats[key] = PathStats(precision=precision)
+        stats[key].add(node)
+    return stats
+
+
+def summary_lines(stats):
+    """Generate jsonpipe-style `path<TAB>stats` lines for :func:`summarize`."""
+
+    for path, path_stats in stats.iteritems():
+        yield path + '\t' + simplejson.dumps(path_stats.as_dict())
+
+
+def type_name(obj):
+
+    """
+    Return the JSON type name of a (parsed) JSON object.
+
+        >>> [type_name(x) for x in ({}, [], u"", 1, 0.5, True, None)]
+        ['object', 'array', 'string', 'number', 'number', 'boolean', 'null']
+    """
+
+    if obj is None:
+        return 'null'
+    elif isinstance(obj, bool):
+        return 'boolean'
+    elif isinstance(obj, (int, long, float)):
+        return 'number'
+    elif isinstance(obj, (str, unicode)):
+        return 'string'
+    elif isinstance(obj, dict):
+        return 'object'
+    return 'array'
+
+
+class PathStats(object):
+
+    """Running statistics for all the nodes seen at a single path."""
+
+    def __init__(self, precision=10):
+        self.count = 0
+        self.types = simplejson.OrderedDict()
+        self.minimum = self.maximum = None
+        self.strings = 0
+        self.min_length = self.max_length = None
+        self.total_length = 0
+        self.distinct = None
+        self.precision = precision
+
+    def add(self, obj):
+        self.count += 1
+        kind = type_name(obj)
+        self.types[kind] = self.types.get(kind, 0) + 1
+
+        if kind == 'number':
+            if self.minimum is None or obj < self.minimum:
+                self.minimum = obj
+            if self.maximum is None or obj > self.maximum:
+                self.maximum = obj
+        elif kind == 'string':
+            if isinstance(obj, str):
+                obj = obj.decode('utf-8')
+            length = len(obj)
+            self.strings += 1
+            self.total_length += length
+            if self.min_length is None or length < self.min_length:
+                self.min_length = length
+            if self.max_length is None or length > self.max_length:
+                self.max_length = length
+
+        if kind not in ('object', 'array'):
+            if self.distinct is None:
+                self.distinct = HyperLogLog(precision=self.precision)
+            self.distinct.add(encode(obj))
+
+    def as_dict(self):
+        output = simplejson.OrderedDict()
+        output['count'] = self.count
+        output['types'] = self.types
+        if self.minimum is not None:
+            output['min'] = self.minimum
+            output['max'] = self.maximum
+        if self.strings:
+            output['min_length'] = self.min_length
+            output['max_length'] = self.max_length
+            output['mean_length'] = float(self.total_length) / self.strings
+        if self.distinct is not None:
+            output['distinct'] = self.distinct.cardinality()
+        return output
+
+
+class HyperLogLog(object):
+
+    """
+    Approximate distinct counter using a fixed number of registers.
+
+        >>> hll = HyperLogLog()
+        >>> for i in xrange(10000):
+        ...     hll.add(str(i % 5000))
+        >>> abs(hll.cardinality() - 5000) < 5000 * 0.1
+        True
+    """
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, string):
+        hashed, = struct.unpack('>Q', hashlib.md5(string).digest()[:8])
+        index = hashed >> (64 - self.precision)
+        remainder = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = min(64 - remainder.bit_length(), 64 - self.precision) + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def cardinality(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count('\x00')
+        if estimate <= 2.5 * size and zeros:
+            # Small-range correction (linear counting).
+            estimate = size * math.log(float(size) / zeros)
+        return int(round(estimate))
@@ -0,0 +1,180 @@
+"""
+Thin client for a running ``jsonpipe-server``.
+
+``jsonpipe-client COMMAND [ARGS...]`` behaves just like running ``COMMAND
+[ARGS...]`` (one of ``jsonpipe``, ``jsonunpipe`` or ``jsonpipe-diff``), but the
+work is done by the server, which has the library already loaded. This module
+lives outside the `jsonpipe` package so that running it imports nothing but
+the few standard library modules needed to talk to the socket. If no server
+is listening, the command is run directly instead.
+
+The socket is ``$JSONPIPE_SOCKET``, or ``jsonpipe.sock`` in
+``$XDG_RUNTIME_DIR``, or failing that in a private ``jsonpipe-<uid>``
+directory under ``$TMPDIR``. The client only connects to a socket belonging to
+the current user which nobody else can use.
+"""
+
+import errno
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+
+__all__ = ['call', 'check_socket', 'main']
+
+
+def _default_socket():
+    if os.environ.get('JSONPIPE_SOCKET'):
+        return os.environ['JSONPIPE_SOCKET']
+    elif os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'jsonpipe.sock')
+    return os.path.join(os.environ.get('TMPDIR', '/tmp'),
+                        'jsonpipe-%d' % os.getuid(), 'jsonpipe.sock')
+
+
+SOCKET = _default_socket()
+
+# Each frame sent back by the server is a channel byte and a 4-byte length,
+# followed by that many bytes of data.
+FRAME_HEADER = struct.Struct('>cI')
+STDOUT, STDERR, EXIT = 'o', 'e', 'x'
+BUFFER_SIZE = 64 * 1024
+
+
+def call(argv, stdin, stdout, stderr, path=SOCKET):
+
+    """
+    Run a command on the server, returning its exit status.
+
+    `argv` is the command name followed by its arguments. The request is a
+    length-prefixed, NUL-separated list of the working directory and `argv`,
+    followed by all of `stdin`. Raises :exc:`socket.error` if no server is
+    listening at `path`, or if it isn't safe to use (see
+    :func:`check_socket`), but not if the connection fails later on.
+    """
+
+    check_socket(path)
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(path)
+    try:
+        request = '\0'.join([os.getcwd()] + list(argv))
+        conn.sendall('%d\n%s' % (len(request), request))
+
+        # Send stdin from another thread, so that output can be read while
+        # input is still being written.
+        sender = threading.Thread(target=send_input, args=(conn, stdin))
+        sender.daemon = True
+        sender.start()
+
+        reader = conn.makefile('rb', BUFFER_SIZE)
+        while True:
+            header = reader.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            channel, length = FRAME_HEADER.unpack(header)
+            data = reader.read(length)
+            if channel == EXIT:
+                stdout.flush()
+                stderr.flush()
+                return int(data)
+            (stdout if channel == STDOUT else stderr).write(data)
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+    stderr.write("jsonpipe-client: lost connection to server\n")
+    return 1
+
+
+def check_socket(path):
+
+    """
+    Raise :exc:`socket.error` unless `path` is a socket only we can use.
+
+    Anyone could have created a socket at a shared path like ``/tmp`` to
+    collect the requests sent to it, so the socket must belong to the current
+    user, and neither it nor its directory may be open to anyone else.
+
+        >>> import os, shutil, socket, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'jsonpipe.sock')
+        >>> check_socket(path)
+        Traceback (most recent call last):
+        ...
+        error: [Errno 2] No such file or directory
+        >>> listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        >>> listener.bind(path)
+        >>> os.chmod(path, 0700)
+        >>> check_socket(path)
+        >>> os.chmod(path, 0777)
+        >>> check_socket(path)
+        Traceback (most recent call last):
+        ...
+        error: [Errno 1] .../jsonpipe.sock is not a private socket
+        >>> os.chmod(path, 0700)
+        >>> os.chmod(directory, 0777)
+        >>> check_socket(path)
+        Traceback (most recent call last):
+        ...
+        error: [Errno 1] ... is not a private directory
+        >>> listener.close()
+        >>> shutil.rmtree(directory)
+    """
+
+    try:
+        info = os.stat(path)
+        parent = os.stat(os.path.dirname(os.path.abspath(path)))
+    except OSError, exc:
+        raise socket.error(exc.errno, exc.strerror)
+    if not (stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid() and
+            not info.st_mode & 0077):
+        raise socket.error(errno.EPERM, "%s is not a private socket" % (path,))
+    # Unless only the owner of a file can remove it (as in /tmp), anyone who
+    # can write to the directory could swap in their own socket.
+    if not (parent.st_mode & stat.S_ISVTX or
+            (parent.st_uid in (0, os.getuid()) and
+             not parent.st_mode & 0022)):
+        raise socket.error(errno.EPERM, "%s is not a private directory"
+                           % (os.path.dirname(os.path.abspath(path)),))
+
+
+def send_input(conn, stdin):
+    if hasattr(stdin, 'fileno'):
+        fd = stdin.fileno()
+        read = lambda: os.read(fd, BUFFER_SIZE)
+    else:
+        read = lambda: stdin.read(BUFFER_SIZE)
+    try:
+        for chunk in iter(read, ''):
+            conn.sendall(chunk)
+        conn.shutdown(socket.SHUT_WR)
+    except socket.error:
+        # The server has finished (or died) without reading all the input.
+        pass
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.stderr.write("usage: jsonpipe-client COMMAND [ARGS...]\n")
+        sys.exit(2)
+
+    try:
+        status = call(sys.argv[1:], sys.stdin, sys.stdout, sys.stderr)
+    except socket.error, exc:
+        # No (usable) server; fall back to running the command ourselves.
+        if exc.errno == errno.EPERM:
+            sys.stderr.write("jsonpipe-client: not using server: %s\n" %
+                             (exc.strerror,))
+        try:
+            os.execvp(sys.argv[1], sys.argv[1:])
+        except OSError, exc:
+            sys.stderr.write("jsonpipe-client: %s: %s\n" %
+                             (sys.argv[1], exc.strerror))
+            sys.exit(127)
+    except IOError:
+        # Most likely a broken pipe on stdout (e.g. piping into `head`).
+        status = 1
+    sys.exit(status)